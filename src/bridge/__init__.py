@@ -8,6 +8,7 @@ import sys
 import time
 import traceback
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import atexit
 import functools
 import urllib.parse as urlparse
@@ -61,6 +62,8 @@ class WB:
     savecv = threading.Condition()
     # a map file-extension -> application plugin
     plugins = {}
+    # a pool of threads to overlap independent WOPI calls on the open path
+    httppool = ThreadPoolExecutor(max_workers=16)
 
     @classmethod
     def init(cls, config, log, secret):
@@ -72,6 +75,8 @@ class WB:
         cls.hashsecret = secret
         cls.log = wopic.log = log
         wopic.sslverify = cls.sslverify
+        # configure certificate validation once on the shared session, rather than on every call
+        wopic.sess.verify = cls.sslverify
 
     @classmethod
     def loadplugin(cls, appname, appurl, appinturl, apikey):
@@ -85,7 +90,6 @@ class WB:
         try:
             cls.plugins[p] = __import__('bridge.' + p, globals(), locals(), [p])
             cls.plugins[p].log = cls.log
-            cls.plugins[p].sslverify = cls.sslverify
             cls.plugins[p].disablezip = cls.disablezip
             cls.plugins[p].appname = appname
             cls.plugins[p].init(appurl, appinturl, apikey)
@@ -137,8 +141,11 @@ def appopen(wopisrc, acctok, appname, viewmode):
     if not isinstance(acctok, str):
         # TODO when using the wopiopen.py tool, the access token has to be decoded, to be clarified
         acctok = acctok.decode()
-    # WOPI GetFileInfo
-    res = wopic.request(wopisrc, acctok, 'GET')
+    # WOPI GetFileInfo and GetLock: the two calls are independent for a given access token,
+    # so they are fired concurrently to overlap their round trips to the WOPI server
+    filemdfut = WB.httppool.submit(wopic.request, wopisrc, acctok, 'GET')
+    lockfut = WB.httppool.submit(wopic.getlock, wopisrc, acctok)
+    res = filemdfut.result()
     if res.status_code != http.client.OK:
         WB.log.warning('msg="BridgeOpen: unable to fetch file WOPI metadata" response="%d"' % res.status_code)
         raise FailedOpen('Invalid WOPI context', http.client.NOT_FOUND)
@@ -155,7 +162,7 @@ def appopen(wopisrc, acctok, appname, viewmode):
         if filemd['UserCanWrite']:
             try:
                 # was it already being worked on?
-                wopilock = wopic.getlock(wopisrc, acctok)
+                wopilock = lockfut.result()
                 WB.log.info('msg="Lock already held" lock="%s" token="%s"' % (wopilock, acctok[-20:]))
                 # add this token to the list, if not already in
                 if acctok[-20:] not in wopilock['tocl']:
@@ -169,7 +176,7 @@ def appopen(wopisrc, acctok, appname, viewmode):
                 # otherwise, this is the first user opening the file; in both cases, fetch it
                 wopilock = app.loadfromstorage(filemd, wopisrc, acctok, _gendocid(wopisrc))
                 # and WOPI Lock it
-                res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': json.dumps(wopilock),
+                res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': wopic.encodelock(wopilock),
                                                                       'X-Wopi-Override': 'LOCK'})
                 if res.status_code != http.client.OK:
                     # failed to lock the file: open in read-only mode
@@ -397,7 +404,7 @@ class SaveThread(threading.Thread):
                 if openfile['lastsave'] < int(time.time()) - WB.unlockinterval:
                     # nobody is still on this document and some time has passed, unlock
                     res = wopic.request(wopisrc, openfile['acctok'], 'POST',
-                                        headers={'X-WOPI-Lock': json.dumps(wopilock), 'X-Wopi-Override': 'UNLOCK'})
+                                        headers={'X-WOPI-Lock': wopic.encodelock(wopilock), 'X-Wopi-Override': 'UNLOCK'})
                     if res.status_code != http.client.OK:
                         WB.log.warning('msg="SaveThread: failed to unlock" lastsavetime="%s" token="%s" response="%s"' %
                                        (openfile['lastsave'], openfile['acctok'][-20:], res.status_code))
@@ -10,8 +10,9 @@ import os
 import re
 import zipfile
 import io
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from random import randint
-import json
 import urllib.parse as urlparse
 import http.client
 import requests
@@ -20,15 +21,18 @@ import core.wopiutils as utils
 
 TOOLARGE = 'File is too large to be edited in CodiMD. Please reduce its size with a regular text editor and try again.'
 
-# a regexp for uploads, that have links like '/uploads/upload_542a360ddefe1e21ad1b8c85207d9365.*'
-upload_re = re.compile(r'\/uploads\/upload_\w{32}\.\w+')
+# a regexp for uploads, that have links like '/uploads/upload_542a360ddefe1e21ad1b8c85207d9365.*':
+# it is compiled as a bytes pattern to scan documents without decoding them
+upload_re = re.compile(rb'\/uploads\/upload_\w{32}\.\w+')
+
+# a pool of threads to fetch attachments concurrently from CodiMD
+_fetchpool = ThreadPoolExecutor(max_workers=8)
 
 # initialized by the main class or by the init method
 appurl = None
 appexturl = None
 apikey = None
 log = None
-sslverify = None
 disablezip = None
 
 
@@ -46,7 +50,7 @@ def init(_appurl, _appinturl, _apikey):
     apikey = _apikey
     try:
         # CodiMD integrates Prometheus metrics, let's probe if they exist
-        res = requests.head(appurl + '/metrics/codimd', verify=sslverify)
+        res = wopic.sess.head(appurl + '/metrics/codimd')
         if res.status_code != http.client.OK:
             log.error('msg="The provided URL does not seem to be a CodiMD instance" appurl="%s"' % appurl)
             raise AppFailure
@@ -69,8 +73,7 @@ def getredirecturl(viewmode, wopisrc, acctok, docid, displayname):
         return f'{appexturl}/{docid}?{mode}&{urlparse.urlencode(params)}'
 
     # read-only mode: first check if we have a CodiMD redirection
-    res = requests.head(appurl + '/' + docid,
-                        verify=sslverify)
+    res = wopic.sess.head(appurl + '/' + docid)
     if res.status_code == http.client.FOUND:
         return '%s/s/%s' % (appexturl, urlparse.urlsplit(res.next.url).path.split('/')[-1])
     # we used to redirect to publish mode or normal view to quickly jump in slide mode depending on the content,
@@ -89,11 +92,11 @@ def _unzipattachments(inputbuf):
     for zipinfo in inputzip.infolist():
         fname = zipinfo.filename
         log.debug('msg="Extracting attachment" name="%s"' % fname)
-        if os.path.splitext(fname)[1] == '.md':
+        if fname.endswith('.md'):
             mddoc = inputzip.read(zipinfo)
         else:
             # first check if the file already exists in CodiMD:
-            res = requests.head(appurl + '/uploads/' + fname, verify=sslverify)
+            res = wopic.sess.head(appurl + '/uploads/' + fname)
             if res.status_code == http.client.OK and int(res.headers['Content-Length']) == zipinfo.file_size:
                 # yes (assume that hashed filename AND size matching is a good enough content match!)
                 log.debug('msg="Skipped existing attachment" filename="%s"' % fname)
@@ -106,10 +109,12 @@ def _unzipattachments(inputbuf):
                 fname = name + '_' + chr(randint(65, 65+26)) + ext
                 # and replace its reference in the document (this creates a copy of the doc, not very efficient)
                 mddoc = mddoc.replace(bytes(zipinfo.filename), bytes(fname))
-            # OK, let's upload
+            # OK, let's upload: stream the entry straight out of the archive,
+            # without materializing it as a whole in memory
             log.debug('msg="Pushing attachment" filename="%s"' % fname)
-            res = requests.post(appurl + '/uploadimage', params={'generateFilename': 'false'},
-                                files={'image': (fname, inputzip.read(zipinfo))}, verify=sslverify)
+            with inputzip.open(zipinfo) as attcontent:
+                res = wopic.sess.post(appurl + '/uploadimage', params={'generateFilename': 'false'},
+                                      files={'image': (fname, attcontent)})
             if res.status_code != http.client.OK:
                 log.error('msg="Failed to push included file" filename="%s" httpcode="%d"' % (fname, res.status_code))
     if mddoc:
@@ -120,13 +125,13 @@ def _unzipattachments(inputbuf):
 
 #def _isslides(doc):
 #    '''Heuristically look for signatures of slides in the header of a md document'''
-#    return doc[:9].decode() == '---\ntitle' or doc[:8].decode() == '---\ntype' or doc[:16].decode() == '---\nslideOptions'
+#    return doc.startswith((b'---\ntitle', b'---\ntype', b'---\nslideOptions'))
 
 
 def _fetchfromcodimd(wopilock, acctok):
     '''Fetch a given document from from CodiMD, raise AppFailure in case of errors'''
     try:
-        res = requests.get(appurl + ('/' if wopilock['doc'][0] != '/' else '') + wopilock['doc'] + '/download', verify=sslverify)
+        res = wopic.sess.get(appurl + ('/' if wopilock['doc'][0] != '/' else '') + wopilock['doc'] + '/download')
         if res.status_code != http.client.OK:
             log.error('msg="Unable to fetch document from CodiMD" token="%s" response="%d: %s"' %
                       (acctok[-20:], res.status_code, res.content.decode()))
@@ -144,7 +149,7 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
     if res.status_code != http.client.OK:
         raise AppFailure('Unable to fetch file from storage, got HTTP %d' % res.status_code)
     mdfile = res.content
-    wasbundle = os.path.splitext(filemd['BaseFileName'])[1] == '.zmd'
+    wasbundle = filemd['BaseFileName'].endswith('.zmd')
 
     # if it's a bundled file, unzip it and push the attachments in the appropriate folder
     if wasbundle:
@@ -154,11 +159,10 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
     try:
         if not docid:
             # read-only case: push the doc to a newly generated note with a random docid
-            res = requests.post(appurl + '/new', data=mddoc,
-                                allow_redirects=False,
-                                params={'mode': 'locked'},
-                                headers={'Content-Type': 'text/markdown'},
-                                verify=sslverify)
+            res = wopic.sess.post(appurl + '/new', data=mddoc,
+                                  allow_redirects=False,
+                                  params={'mode': 'locked'},
+                                  headers={'Content-Type': 'text/markdown'})
             if res.status_code == http.client.REQUEST_ENTITY_TOO_LARGE:
                 log.error('msg="File is too large to be edited in CodiMD" token="%s"')
                 raise AppFailure(TOOLARGE)
@@ -170,9 +174,7 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
             log.info('msg="Pushed read-only document to CodiMD" docid="%s" token="%s"' % (docid, acctok[-20:]))
         else:
             # reserve the given docid in CodiMD via a HEAD request
-            res = requests.head(appurl + '/' + docid,
-                                allow_redirects=False,
-                                verify=sslverify)
+            res = wopic.sess.head(appurl + '/' + docid, allow_redirects=False)
             if res.status_code not in (http.client.OK, http.client.FOUND):
                 log.error('msg="Unable to reserve note hash in CodiMD" token="%s" response="%d"' %
                           (acctok[-20:], res.status_code))
@@ -186,9 +188,7 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
             else:
                 log.debug('msg="Got note hash from CodiMD" docid="%s"' % docid)
             # push the document to CodiMD with the update API
-            res = requests.put(appurl + '/api/notes/' + docid,
-                               json={'content': mddoc.decode()},
-                               verify=sslverify)
+            res = wopic.sess.put(appurl + '/api/notes/' + docid, json={'content': mddoc.decode()})
             if res.status_code == http.client.FORBIDDEN:
                 # the file got unlocked because of no activity, yet some user is there: let it go
                 log.warning('msg="Document was being edited in CodiMD, redirecting user" token"%s"' % acctok[-20:])
@@ -216,24 +216,37 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
 
 def _getattachments(mddoc, docfilename, forcezip=False):
     '''Parse a markdown file and generate a zip file containing all included files'''
+    # probe for the first attachment within a single scan of the document: if none is
+    # referenced we can return right away, without allocating any zip machinery
+    matches = upload_re.finditer(mddoc)
+    first = next(matches, None)
+    if not first and not forcezip:
+        return None, None
+    if first:
+        matches = itertools.chain([first], matches)
     zip_buffer = io.BytesIO()
     response = None
-    for attachment in upload_re.findall(mddoc):
-        log.debug('msg="Fetching attachment" url="%s"' % attachment)
-        res = requests.get(appurl + attachment, verify=sslverify)
-        if res.status_code != http.client.OK:
-            log.error('msg="Failed to fetch included file, skipping" path="%s" response="%d"' % (
-                attachment, res.status_code))
-            # also notify the user
-            response = wopic.jsonify('Failed to include a referenced picture in the saved file'), http.client.NOT_FOUND
-            continue
-        with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_STORED, allowZip64=False) as zip_file:
+    included = False
+    # fetch all attachments in parallel, so that the overall wall time is bound by the slowest
+    # round trip to CodiMD rather than by the sum of all of them
+    attachments = (m.group().decode() for m in matches)
+    fetched = _fetchpool.map(lambda a: (a, wopic.sess.get(appurl + a)), attachments)
+    # open the zip file once and write all entries in a single pass
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED, allowZip64=False) as zip_file:
+        for attachment, res in fetched:
+            log.debug('msg="Fetched attachment" url="%s"' % attachment)
+            if res.status_code != http.client.OK:
+                log.error('msg="Failed to fetch included file, skipping" path="%s" response="%d"' % (
+                    attachment, res.status_code))
+                # also notify the user
+                response = wopic.jsonify('Failed to include a referenced picture in the saved file'), http.client.NOT_FOUND
+                continue
             zip_file.writestr(attachment.split('/')[-1], res.content)
-    if not forcezip and zip_buffer.getbuffer().nbytes == 0:
-        # no attachments actually found
-        return None, response
-    # also include the markdown file itself
-    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_STORED, allowZip64=False) as zip_file:
+            included = True
+        if not forcezip and not included:
+            # no attachments actually found
+            return None, response
+        # also include the markdown file itself
         zip_file.writestr(docfilename, mddoc)
     return zip_buffer.getvalue(), response
 
@@ -257,15 +270,15 @@ def savetostorage(wopisrc, acctok, isclose, wopilock, onlyfetch=False):
         return '{}', http.client.ACCEPTED
 
     # check if we have attachments
-    wasbundle = os.path.splitext(wopilock['fn'])[1] == '.zmd'
+    wasbundle = wopilock['fn'].endswith('.zmd')
     bundlefile = attresponse = None
     if not disablezip or wasbundle:     # in disablezip mode, preserve existing .zmd files but don't create new ones
-        bundlefile, attresponse = _getattachments(mddoc.decode(), wopilock['fn'].replace('.zmd', '.md'),
+        bundlefile, attresponse = _getattachments(mddoc, wopilock['fn'].replace('.zmd', '.md'),
                                                   (wasbundle and not isclose))
 
     # WOPI PutFile for the file or the bundle if it already existed
     if (wasbundle ^ (not bundlefile)) or not isclose:
-        res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': json.dumps(wopilock)},
+        res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': wopic.encodelock(wopilock)},
                             contents=(bundlefile if wasbundle else mddoc))
         reply = wopic.handleputfile('PutFile', wopisrc, res)
         if reply:
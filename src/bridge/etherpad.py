@@ -8,7 +8,6 @@ Main author: Giuseppe.LoPresti@cern.ch, CERN/IT-ST
 
 from random import choice
 from string import ascii_lowercase
-import json
 import http.client
 import urllib.parse as urlparse
 import requests
@@ -20,7 +19,6 @@ appurl = None
 appexturl = None
 apikey = None
 log = None
-sslverify = None
 groupid = None
 
 
@@ -47,7 +45,7 @@ def _apicall(method, params, data=None, acctok=None, raiseonnonzerocode=True):
     '''Generic method to call the Etherpad REST API'''
     params['apikey'] = apikey
     try:
-        res = requests.post(appurl + '/api/1/' + method, params=params, data=data, verify=sslverify)
+        res = wopic.sess.post(appurl + '/api/1/' + method, params=params, data=data)
         if res.status_code != http.client.OK:
             log.error('msg="Failed to call Etherpad" method="%s" token="%s" response="%d: %s"' %
                       (method, acctok[-20:] if acctok else 'N/A', res.status_code, res.content.decode()))
@@ -69,10 +67,9 @@ def getredirecturl(viewmode, wopisrc, acctok, docid, displayname):
     '''Return a valid URL to the app for the given WOPI context'''
     # pass to Etherpad the required metadata for the save webhook
     try:
-        res = requests.post(appurl + '/setEFSSMetadata',
-                            params={'padID': docid, 'wopiSrc': urlparse.quote_plus(wopisrc), 'accessToken': acctok,
-                                    'apikey': apikey},
-                            verify=sslverify)
+        res = wopic.sess.post(appurl + '/setEFSSMetadata',
+                              params={'padID': docid, 'wopiSrc': urlparse.quote_plus(wopisrc), 'accessToken': acctok,
+                                      'apikey': apikey})
         if res.status_code != http.client.OK or res.json()['code'] != 0:
             log.error('msg="Failed to call Etherpad" method="setEFSSMetadata" token="%s" response="%d: %s"' %
                       (acctok[-20:], res.status_code, res.content.decode().replace('"', "'")))
@@ -112,10 +109,9 @@ def loadfromstorage(filemd, wopisrc, acctok, docid):
         _apicall('createGroupPad', {'groupID': groupid, 'padName': docid, 'text': 'placeholder'},
                  acctok=acctok, raiseonnonzerocode=False)
         # push content: a .etherpad file is imported as raw (JSON) content
-        res = requests.post(appurl + '/p/' + docid + '/import',
-                            files={'file': (docid + '.etherpad', epfile, 'application/json')},
-                            params={'apikey': apikey},
-                            verify=sslverify)
+        res = wopic.sess.post(appurl + '/p/' + docid + '/import',
+                              files={'file': (docid + '.etherpad', epfile, 'application/json')},
+                              params={'apikey': apikey})
         if res.status_code != http.client.OK:
             log.error('msg="Unable to push document to Etherpad" token="%s" padid="%s" response="%d: %s" content="%s"' %
                         (acctok[-20:], docid, res.status_code, res.content.decode(), epfile.decode()))
@@ -135,8 +131,7 @@ def _fetchfrometherpad(wopilock, acctok):
     '''Fetch a given document from from Etherpad, raise AppFailure in case of errors'''
     try:
         # this operation does not use the API (and it is NOT protected by the API key!), so we use a plain GET
-        res = requests.get(appurl + '/p' + wopilock['doc'] + '/export/etherpad',
-                           verify=sslverify)
+        res = wopic.sess.get(appurl + '/p' + wopilock['doc'] + '/export/etherpad')
         if res.status_code != http.client.OK:
             log.error('msg="Unable to fetch document from Etherpad" token="%s" response="%d: %s"' %
                       (acctok[-20:], res.status_code, res.content.decode()))
@@ -166,7 +161,7 @@ def savetostorage(wopisrc, acctok, isclose, wopilock, onlyfetch=False):
         return '{}', http.client.ACCEPTED
 
     # WOPI PutFile
-    res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': json.dumps(wopilock)},
+    res = wopic.request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': wopic.encodelock(wopilock)},
                         contents=epfile)
     reply = wopic.handleputfile('PutFile', wopisrc, res)
     if reply:
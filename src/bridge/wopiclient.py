@@ -6,9 +6,9 @@ A set of WOPI client functions for the WOPI bridge service.
 Main author: Giuseppe.LoPresti@cern.ch, CERN/IT-ST
 '''
 
-import json
 import hashlib
 import http.client
+import orjson
 import requests
 from flask import Response
 
@@ -21,6 +21,19 @@ class InvalidLock(Exception):
 log = None
 sslverify = None
 
+# a shared requests session, pooling connections to the WOPI server and to the bridged apps:
+# this amortizes the TCP and TLS handshakes across all calls to the same backend
+sess = requests.Session()
+_adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=64)
+sess.mount('http://', _adapter)
+sess.mount('https://', _adapter)
+
+
+def encodelock(lock):
+    '''One-liner to serialize a lock structure for the WOPI lock headers.
+    Uses orjson as this sits on the hot path of every lock operation'''
+    return orjson.dumps(lock).decode()
+
 
 def jsonify(msg):
     '''One-liner to consistently json-ify a given message and pass a delay.
@@ -38,10 +51,9 @@ def request(wopisrc, acctok, method, contents=None, headers=None):
         log.debug('msg="Calling WOPI" url="%s" headers="%s" acctok="%s" ssl="%s"' %
                   (wopiurl, headers, acctok[-20:], sslverify))
         if method == 'GET':
-            return requests.get('%s?access_token=%s' % (wopiurl, acctok), verify=sslverify)
+            return sess.get('%s?access_token=%s' % (wopiurl, acctok))
         if method == 'POST':
-            return requests.post('%s?access_token=%s' % (wopiurl, acctok), verify=sslverify,
-                                 headers=headers, data=contents)
+            return sess.post('%s?access_token=%s' % (wopiurl, acctok), headers=headers, data=contents)
     except (requests.exceptions.ConnectionError, IOError) as e:
         log.error('msg="Unable to contact WOPI" wopiurl="%s" acctok="%s" response="%s"' % (wopiurl, acctok, e))
         res = Response()
@@ -87,15 +99,16 @@ def getlock(wopisrc, acctok):
             # lock got lost or any other error
             raise InvalidLock(res.status_code)
         # the lock is expected to be a JSON dict, see generatelock()
-        return json.loads(res.headers['X-WOPI-Lock'])
-    except (ValueError, KeyError, json.decoder.JSONDecodeError) as e:
+        return orjson.loads(res.headers['X-WOPI-Lock'])
+    except (ValueError, KeyError) as e:
         log.warning('msg="Missing or malformed WOPI lock" exception="%s" error="%s"' % (type(e), e))
         raise InvalidLock(e)
 
 
 def _getheadersforrefreshlock(acctok, wopilock, digest, toclose):
     '''Helper function for refreshlock to generate the old and new lock structures'''
-    newlock = json.loads(json.dumps(wopilock))    # this is a hack for a deep copy
+    newlock = wopilock.copy()
+    newlock['tocl'] = dict(wopilock['tocl'])    # 'tocl' is the only nested structure and may be amended below
     if toclose:
         # we got the full 'toclose' dict, push it as is
         newlock['tocl'] = toclose
@@ -106,8 +119,8 @@ def _getheadersforrefreshlock(acctok, wopilock, digest, toclose):
         newlock['dig'] = digest
     return {
         'X-Wopi-Override': 'REFRESH_LOCK',
-        'X-WOPI-OldLock': json.dumps(wopilock),
-        'X-WOPI-Lock': json.dumps(newlock)
+        'X-WOPI-OldLock': encodelock(wopilock),
+        'X-WOPI-Lock': encodelock(newlock)
     }, newlock
 
 
@@ -121,8 +134,8 @@ def refreshlock(wopisrc, acctok, wopilock, digest=None, toclose=None):
         # we have a race condition, another thread has updated the lock before us
         log.warning('msg="Got conflict in refreshing lock, retrying" url="%s"' % wopisrc)
         try:
-            currlock = json.loads(res.headers['X-WOPI-Lock'])
-        except json.decoder.JSONDecodeError as e:
+            currlock = orjson.loads(res.headers['X-WOPI-Lock'])
+        except orjson.JSONDecodeError as e:
             log.error('msg="Got unresolvable conflict in RefreshLock" url="%s" previouslock="%s" error="%s"' %
                       (wopisrc, res.headers.get('X-WOPI-Lock'), e))
             raise InvalidLock('Found existing malformed lock on refreshlock')
@@ -171,7 +184,7 @@ def relock(wopisrc, acctok, docid, isclose):
     # lock the file again: we assume we are alone as the previous lock had been released
     wopilock = generatelock(docid, filemd, None, acctok, isclose)
     lockheaders = {
-        'X-WOPI-Lock': json.dumps(wopilock),
+        'X-WOPI-Lock': encodelock(wopilock),
         'X-WOPI-Override': 'REFRESH_LOCK',
         'X-WOPI-Validate-Target': 'True'    # this is an extension of the Lock API
     }
@@ -206,7 +219,7 @@ def handleputfile(wopicall, wopisrc, res):
 def saveas(wopisrc, acctok, wopilock, targetname, content):
     '''Save a given document with an alternate name by using WOPI PutRelative'''
     putrelheaders = {
-        'X-WOPI-Lock': json.dumps(wopilock),
+        'X-WOPI-Lock': encodelock(wopilock),
         'X-WOPI-Override': 'PUT_RELATIVE',
         # SuggestedTarget to not overwrite a possibly existing file
         'X-WOPI-SuggestedTarget': targetname
@@ -220,7 +233,7 @@ def saveas(wopisrc, acctok, wopilock, targetname, content):
     # because we need to keep using the current wopisrc/acctok until the session is alive in the app
     newname = res.json()['Name']
     # unlock and delete original file
-    res = request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': json.dumps(wopilock), 'X-Wopi-Override': 'UNLOCK'})
+    res = request(wopisrc, acctok, 'POST', headers={'X-WOPI-Lock': encodelock(wopilock), 'X-Wopi-Override': 'UNLOCK'})
     if res.status_code != http.client.OK:
         log.warning('msg="Failed to unlock the previous file" token="%s" response="%d"' %
                     (acctok[-20:], res.status_code))
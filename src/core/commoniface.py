@@ -8,9 +8,10 @@ Main author: Giuseppe.LoPresti@cern.ch, CERN/IT-ST
 '''
 
 import time
-import json
+import functools
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 from binascii import Error as B64Error
+import orjson
 
 
 # standard file missing message
@@ -33,6 +34,10 @@ WEBDAV_LOCK_PREFIX = 'opaquelocktoken:797356a8-0500-4ceb-a8a0-c94c8cde7eba'
 # reference to global config
 config = None
 
+# cached lock expiration time, read from the config at first use:
+# ConfigParser lookups traverse its internal maps on every call
+_lockexpiration = None
+
 
 # Manipulate Reva-compliant locks, i.e. JSON structs with the following format:
 # {
@@ -52,27 +57,37 @@ config = None
 def genrevalock(appname, value):
     '''Return a base64-encoded lock compatible with the Reva implementation of the CS3 Lock API
     cf. https://github.com/cs3org/cs3apis/blob/main/cs3/storage/provider/v1beta1/resources.proto'''
+    global _lockexpiration      # pylint: disable=global-statement
+    if _lockexpiration is None:
+        _lockexpiration = config.getint("general", "wopilockexpiration")
+    # orjson.dumps returns bytes, which are fed to the base64 encoder without any intermediate str
     return urlsafe_b64encode(
-        json.dumps(
+        orjson.dumps(
             {
                 "lock_id": value,
                 "type": 2,  # LOCK_TYPE_WRITE
                 "app_name": appname if appname else "wopi",
                 "user": {},
                 "expiration": {
-                    "seconds": int(time.time())
-                    + config.getint("general", "wopilockexpiration")
+                    "seconds": int(time.time()) + _lockexpiration
                 },
             }
-        ).encode()
+        )
     ).decode()
 
 
+@functools.lru_cache(maxsize=4096)
+def _decodelock(rawlock):
+    '''Decodes a raw lock payload: cached, as the same payload gets decoded once per lock
+    operation over the lifetime of a lock. Failures are not cached by lru_cache'''
+    return urlsafe_b64decode(rawlock + '==').decode()
+
+
 def retrieverevalock(rawlock):
     '''Restores the JSON payload from a base64-encoded Reva lock'''
     try:
-        return json.loads(urlsafe_b64decode(rawlock + '==').decode())
-    except (B64Error, json.JSONDecodeError) as e:
+        return orjson.loads(_decodelock(rawlock))
+    except (B64Error, orjson.JSONDecodeError) as e:
         raise IOError("Unable to parse existing lock: " + str(e))
 
 
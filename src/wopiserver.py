@@ -74,6 +74,8 @@ class Wopi:
                  }
     log = utils.JsonLogger(app.logger)
     openfiles = {}
+    # the index page, rendered once at the first access
+    indexpage = None
     # sets of sessions for which a lock conflict is outstanding or resolved
     conflictsessions = {'pending': {}, 'resolved': {}}
 
@@ -195,9 +197,16 @@ class Wopi:
                     print("Missing module waitress, aborting")
                     raise
 
-                serve(cls.app, host='0.0.0.0', port=cls.port)
+                serve(cls.app, host='0.0.0.0', port=cls.port,
+                      threads=cls.config.getint('general', 'serverthreads', fallback=16))
             else:
-                cls.app.run(host='0.0.0.0', port=cls.port, ssl_context=cls.app.ssl_context)
+                # the Flask embedded server is meant for development only: production deployments
+                # ought to set internalserver = waitress, or terminate TLS on a reverse proxy
+                cls.log.warning('msg="Running with the Flask development server, '
+                                'not recommended for production use"')
+                # the reloader stats all source files at every tick and respawns the process:
+                # explicitly disable it also when the debug mode is enabled via loglevel
+                cls.app.run(host='0.0.0.0', port=cls.port, ssl_context=cls.app.ssl_context, use_reloader=False)
         except OSError as e:
             cls.log.fatal('msg="Failed to run the service, aborting" error="%s"' % e)
             raise
@@ -221,7 +230,10 @@ def redir():
 def index():
     '''Return a default index page with some user-friendly information about this service'''
     Wopi.log.debug('msg="Accessed index page" client="%s"' % flask.request.remote_addr)
-    resp = flask.Response("""
+    if not Wopi.indexpage:
+        # render the page once and keep it cached: it is static for the lifetime of the process,
+        # and in particular getfqdn() may incur a DNS lookup
+        Wopi.indexpage = """
       <html><head><title>ScienceMesh WOPI Server</title></head>
       <body>
       <div align="center" style="color:#000080; padding-top:50px; font-family:Verdana; size:11">
@@ -233,7 +245,8 @@ def index():
       <i>ScienceMesh WOPI Server %s at %s. Powered by Flask %s for Python %s</i>.
       </body>
       </html>
-      """ % (WOPISERVERVERSION, socket.getfqdn(), flask.__version__, python_version()))
+      """ % (WOPISERVERVERSION, socket.getfqdn(), flask.__version__, python_version())
+    resp = flask.Response(Wopi.indexpage)
     resp.headers['X-Frame-Options'] = 'sameorigin'
     resp.headers['X-XSS-Protection'] = '1; mode=block'
     return resp